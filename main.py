@@ -1,27 +1,145 @@
 #!/usr/bin/env python3
 """
 BlackRoad Notebook Server - Jupyter notebook server with AI kernels
+
+Storage: the SQLite database runs in WAL mode with ``synchronous=NORMAL``.
+Commits are durable across application crashes, but the most recent
+transactions may be rolled back after a power loss or OS crash.  The
+database itself is never corrupted by this.
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
 import base64
+import functools
 import hashlib
+import html
 import json
 import os
 import re
+import selectors
 import sqlite3
+import stat
 import subprocess
 import sys
+import tempfile
+import textwrap
+import threading
 import time
 import urllib.error
 import urllib.request
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict, dataclass, field
-from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, Union
+
+try:  # optional C-accelerated JSON; stdlib json is used when unavailable
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# ─────────────────────────────────────────────
+# JSON helpers
+# ─────────────────────────────────────────────
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize *obj* to UTF-8 JSON bytes, indented by 2 if *indent*."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode()
+
+
+def json_loads(data: bytes | str) -> Any:
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# ─────────────────────────────────────────────
+# Timestamps
+# ─────────────────────────────────────────────
+
+# (epoch second, "YYYY-MM-DDTHH:MM:SS") of the last formatted timestamp
+_ts_prefix: tuple[int, str] = (-1, "")
+
+
+def utc_iso(ns: Optional[int] = None) -> str:
+    """Format epoch nanoseconds (default: now) as an ISO-8601 UTC string.
+
+    The date/time prefix is cached per second, so most calls only format the
+    microsecond suffix.
+    """
+    global _ts_prefix
+    if ns is None:
+        ns = time.time_ns()
+    sec, frac = divmod(ns, 1_000_000_000)
+    cached_sec, prefix = _ts_prefix
+    if sec != cached_sec:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        _ts_prefix = (sec, prefix)
+    return f"{prefix}.{frac // 1000:06d}"
+
+
+# ─────────────────────────────────────────────
+# Files
+# ─────────────────────────────────────────────
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+# mkstemp creates files 0600; new files get the usual umask-derived mode.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def fsync_path(path: Path | str) -> None:
+    """Flush a file's data, or a directory's entries, to stable storage."""
+    is_dir = os.path.isdir(path)
+    try:
+        fd = os.open(path, os.O_RDONLY | (getattr(os, "O_DIRECTORY", 0) if is_dir else 0))
+    except OSError:
+        if is_dir:  # directories cannot be opened on every platform
+            return
+        raise
+    try:
+        (os.fsync if is_dir else _fdatasync)(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path | str, data: bytes, fsync: bool = False) -> None:
+    """Write *data* to *path* via a temp file and an atomic rename.
+
+    Readers never observe a partially written file, and an existing file
+    keeps its permission bits.  With *fsync* the data
+    and the rename are flushed to disk before returning; otherwise durability
+    is left to the OS (see ``JupyterService.notebook_export_many`` for
+    batching the flush across many files).
+    """
+    path = Path(path)
+    fd, name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    tmp = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            if fsync:
+                fh.flush()
+                _fdatasync(fh.fileno())
+        try:
+            mode = stat.S_IMODE(path.stat().st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if fsync:
+        fsync_path(path.parent)
 
 
 # ─────────────────────────────────────────────
@@ -31,11 +149,26 @@ from typing import Any, Optional
 DB_PATH = Path(os.environ.get("NOTEBOOK_DB", "~/.blackroad/notebooks.db")).expanduser()
 
 
+# sqlite3 connections must not be shared across threads, so each thread keeps
+# exactly one connection that is opened (and tuned) on first use.
+_local = threading.local()
+
+
 def get_conn() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
+    """Return this thread's persistent connection, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(DB_PATH), cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # see module docstring
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
+        _local.conn = conn
     return conn
 
 
@@ -50,7 +183,10 @@ def init_db() -> None:
                 created_at  TEXT NOT NULL,
                 updated_at  TEXT NOT NULL,
                 cell_count  INTEGER NOT NULL DEFAULT 0,
-                metadata    TEXT NOT NULL DEFAULT '{}'
+                metadata    TEXT NOT NULL DEFAULT '{}',
+                cells_blob  BLOB,
+                file_mtime_ns INTEGER,
+                file_size   INTEGER
             );
             CREATE TABLE IF NOT EXISTS executions (
                 id           TEXT PRIMARY KEY,
@@ -71,26 +207,87 @@ def init_db() -> None:
                 argv        TEXT NOT NULL,
                 created_at  TEXT NOT NULL
             );
-            CREATE INDEX IF NOT EXISTS idx_exec_nb ON executions(notebook_id);
+            CREATE TABLE IF NOT EXISTS cell_cache (
+                hash        TEXT PRIMARY KEY,
+                output      TEXT,
+                status      TEXT NOT NULL,
+                created_at  TEXT NOT NULL
+            );
+            -- idx_exec_nb_started also covers lookups by notebook_id alone
+            DROP INDEX IF EXISTS idx_exec_nb;
+            CREATE INDEX IF NOT EXISTS idx_exec_nb_started ON executions(notebook_id, started_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_nb_updated ON notebooks(updated_at DESC);
         """)
+        # Databases created before cells were denormalized lack these columns
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(notebooks)")}
+        for column, decl in (("cells_blob", "BLOB"), ("file_mtime_ns", "INTEGER"), ("file_size", "INTEGER")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE notebooks ADD COLUMN {column} {decl}")
+
+
+# Statements are kept as frozen module-level strings so the connection's
+# statement cache (see ``cached_statements``) hits on every call.
+SQL_INSERT_KERNEL = (
+    "INSERT OR REPLACE INTO kernels(id, name, language, display_name, argv, created_at) "
+    "VALUES (?,?,?,?,?,?)"
+)
+SQL_SELECT_KERNELS = "SELECT * FROM kernels ORDER BY name"
+SQL_INSERT_NOTEBOOK = (
+    "INSERT INTO notebooks(id, name, path, kernel, created_at, updated_at, cell_count, metadata, "
+    "cells_blob, file_mtime_ns, file_size) VALUES (?,?,?,?,?,?,?,?,?,?,?)"
+)
+SQL_UPDATE_NB_CELLS = (
+    "UPDATE notebooks SET cells_blob=?, cell_count=?, file_mtime_ns=?, file_size=? WHERE id=?"
+)
+SQL_SELECT_NB_BY_ID = "SELECT * FROM notebooks WHERE id=?"
+SQL_SELECT_NOTEBOOKS = (
+    "SELECT id, name, path, kernel, created_at, updated_at, cell_count "
+    "FROM notebooks ORDER BY updated_at DESC"
+)
+SQL_TOUCH_NOTEBOOK = "UPDATE notebooks SET updated_at=? WHERE id=?"
+SQL_DELETE_NOTEBOOK = "DELETE FROM notebooks WHERE id=?"
+SQL_INSERT_EXECUTION = (
+    "INSERT INTO executions(id, notebook_id, cell_index, source, output, status, "
+    "started_at, finished_at, duration_ms) VALUES (?,?,?,?,?,?,?,?,?)"
+)
+SQL_SELECT_EXECUTIONS = (
+    "SELECT id, cell_index, status, duration_ms, started_at "
+    "FROM executions WHERE notebook_id=? ORDER BY started_at DESC LIMIT ?"
+)
+SQL_SELECT_EXECUTION_BY_ID = "SELECT * FROM executions WHERE id=?"
+SQL_SELECT_CELL_CACHE = "SELECT output, status FROM cell_cache WHERE hash=?"
+SQL_UPSERT_CELL_CACHE = "INSERT OR REPLACE INTO cell_cache(hash, output, status, created_at) VALUES (?,?,?,?)"
 
 
 # ─────────────────────────────────────────────
 # Data classes
 # ─────────────────────────────────────────────
 
-@dataclass
+@dataclass(slots=True)
 class Cell:
     cell_type: str          # 'code' | 'markdown' | 'raw'
-    source: str
+    source: Union[str, list[str]]   # ipynb line list is kept as loaded
     outputs: list[dict] = field(default_factory=list)
     metadata: dict = field(default_factory=dict)
     execution_count: Optional[int] = None
 
+    @property
+    def source_str(self) -> str:
+        """The source as a single string, joined on demand from a line list."""
+        if isinstance(self.source, str):
+            return self.source
+        return "".join(self.source)
+
     def to_ipynb(self) -> dict:
+        if isinstance(self.source, str):
+            source = self.source.splitlines(keepends=True)
+        elif isinstance(self.source, list):
+            source = self.source
+        else:
+            source = list(self.source)
         base: dict[str, Any] = {
             "cell_type": self.cell_type,
-            "source": self.source.splitlines(keepends=True),
+            "source": source,
             "metadata": self.metadata,
         }
         if self.cell_type == "code":
@@ -100,12 +297,9 @@ class Cell:
 
     @classmethod
     def from_ipynb(cls, data: dict) -> "Cell":
-        src = data.get("source", "")
-        if isinstance(src, list):
-            src = "".join(src)
         return cls(
             cell_type=data.get("cell_type", "code"),
-            source=src,
+            source=data.get("source", ""),
             outputs=data.get("outputs", []),
             metadata=data.get("metadata", {}),
             execution_count=data.get("execution_count"),
@@ -221,38 +415,209 @@ class OllamaService:
             return f"Ollama query failed: {exc}", "error"
 
 
+# ─────────────────────────────────────────────
+# Persistent kernel
+# ─────────────────────────────────────────────
+
+# Runs inside the kernel process: reads one JSON-encoded cell source per line
+# from the command pipe (the original stdin), executes it in a namespace
+# shared by all cells and answers with one JSON line [ok, stdout, stderr] on a
+# dedicated result pipe whose fd is passed in argv.  Cells (and their child
+# processes) see /dev/null as stdin and cannot touch either protocol pipe, so
+# whatever they write to fd 1/2 is plain output.
+_KERNEL_DRIVER = r"""
+import contextlib, io, json, os, sys, traceback
+_cmd = os.fdopen(os.dup(0), "r")
+_res = os.fdopen(int(sys.argv.pop(1)), "w")
+os.set_inheritable(_res.fileno(), False)
+_null = os.open(os.devnull, os.O_RDONLY)
+os.dup2(_null, 0)
+os.close(_null)
+sys.stdin = open(os.devnull)
+_ns = {"__name__": "__main__"}
+for _line in _cmd:
+    _src = json.loads(_line)
+    _so, _se = io.StringIO(), io.StringIO()
+    _ok = True
+    with contextlib.redirect_stdout(_so), contextlib.redirect_stderr(_se):
+        try:
+            exec(compile(_src, "<string>", "exec"), _ns)
+        except SystemExit as _e:
+            # Mirror the exit status a "python -c" subprocess would report
+            if _e.code is not None and _e.code != 0:
+                _ok = False
+                if not isinstance(_e.code, int):
+                    print(_e.code, file=sys.stderr)
+        except BaseException as _e:
+            _ok = False
+            # Skip the driver's own frame so tracebacks match "python -c"
+            traceback.print_exception(type(_e), _e, _e.__traceback__.tb_next)
+    sys.__stdout__.flush()
+    sys.__stderr__.flush()
+    _res.write(json.dumps([_ok, _so.getvalue(), _se.getvalue()]) + "\n")
+    _res.flush()
+"""
+
+
+class PersistentKernel:
+    """A long-lived Python subprocess that executes cells in one namespace.
+
+    Avoids paying interpreter startup for every cell and lets later cells see
+    names defined by earlier ones.  A cell that exceeds its timeout kills the
+    process; the next cell transparently starts a fresh one.
+    """
+
+    def __init__(self) -> None:
+        self._proc: Optional[subprocess.Popen] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._results: Optional[int] = None
+        self._buf = b""
+
+    def __enter__(self) -> "PersistentKernel":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def start(self) -> None:
+        read_fd, write_fd = os.pipe()
+        try:
+            self._proc = subprocess.Popen(
+                [sys.executable, "-u", "-c", _KERNEL_DRIVER, str(write_fd)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                pass_fds=(write_fd,),
+            )
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        self._results = read_fd
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._proc.stdout, selectors.EVENT_READ)
+        self._selector.register(read_fd, selectors.EVENT_READ)
+        self._buf = b""
+
+    def close(self) -> None:
+        if self._proc is None:
+            return
+        if self._selector is not None:
+            self._selector.close()
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+        for stream in (self._proc.stdin, self._proc.stdout):
+            if stream is not None:
+                stream.close()
+        if self._results is not None:
+            os.close(self._results)
+        self._proc = None
+        self._selector = None
+        self._results = None
+
+    def _read_output(self, timeout: float) -> bytes:
+        """Read whatever the cell wrote to stdout/stderr within *timeout*."""
+        data = b""
+        out_fd = self._proc.stdout.fileno()
+        for key, _ in self._selector.select(timeout):
+            if key.fd != out_fd:
+                continue
+            chunk = os.read(out_fd, 65536)
+            if chunk:
+                data += chunk
+            else:  # EOF: the kernel is gone, stop polling its stdout
+                self._selector.unregister(out_fd)
+        return data
+
+    def run(self, source: str, timeout: int = 60) -> tuple[str, str]:
+        """Execute *source* and return (output, status) like ``_run_cell``."""
+        if self._proc is None or self._proc.poll() is not None:
+            self.close()
+            self.start()
+        proc, selector = self._proc, self._selector
+        try:
+            proc.stdin.write(json.dumps(source).encode() + b"\n")
+            proc.stdin.flush()
+        except OSError as exc:
+            self.close()
+            return str(exc), "error"
+
+        deadline = time.monotonic() + timeout
+        stray = b""
+        while b"\n" not in self._buf:
+            remaining = deadline - time.monotonic()
+            events = selector.select(remaining) if remaining > 0 else []
+            if not events:
+                self.close()
+                return "Execution timed out", "timeout"
+            for key, _ in events:
+                if key.fd == self._results:
+                    chunk = os.read(self._results, 65536)
+                    if not chunk:
+                        stray += self._read_output(0)
+                        self.close()
+                        return stray.decode(errors="replace") or "Kernel exited unexpectedly", "error"
+                    self._buf += chunk
+                else:
+                    stray += self._read_output(0)
+
+        line, _, self._buf = self._buf.partition(b"\n")
+        # Output written straight to the fd (e.g. by child processes) was
+        # flushed before the result, so collect what is still in the pipe
+        while True:
+            more = self._read_output(0)
+            if not more:
+                break
+            stray += more
+        ok, out, err = json.loads(line)
+        if ok:
+            return stray.decode(errors="replace") + out or "(no output)", "success"
+        return err or "(error)", "error"
+
+
 # ─────────────────────────────────────────────
 # JupyterService
 # ─────────────────────────────────────────────
 
+# Pre-initialised digest; copying it skips OpenSSL context setup per cell.
+_SHA256 = hashlib.sha256()
+
+
+def cell_hash(source: str) -> str:
+    """Return the hex SHA-256 of a cell's source, used as the output cache key."""
+    h = _SHA256.copy()
+    h.update(source.encode())
+    return h.hexdigest()
+
+
 class JupyterService:
     """Core service for managing notebooks, kernels, and executions."""
 
+    def __init__(self) -> None:
+        self._conn = get_conn()
+
     # ── Kernel management ──────────────────────────────────────────────
 
     def register_kernel(self, name: str, language: str, display_name: str, argv: list[str]) -> dict:
         """Register a new kernel spec."""
         kid = str(uuid.uuid4())
-        now = datetime.utcnow().isoformat()
-        with get_conn() as conn:
+        now = utc_iso()
+        with self._conn as conn:
             conn.execute(
-                "INSERT OR REPLACE INTO kernels(id, name, language, display_name, argv, created_at) "
-                "VALUES (?,?,?,?,?,?)",
+                SQL_INSERT_KERNEL,
                 (kid, name, language, display_name, json.dumps(argv), now),
             )
         return {"id": kid, "name": name, "language": language}
 
     def list_kernels(self) -> list[dict]:
-        with get_conn() as conn:
-            rows = conn.execute("SELECT * FROM kernels ORDER BY name").fetchall()
-        return [dict(r) for r in rows]
+        return self._fetch_dicts(SQL_SELECT_KERNELS)
 
     # ── Notebook CRUD ──────────────────────────────────────────────────
 
     def notebook_create(self, name: str, path: str, kernel: str = "python3", cells: Optional[list[dict]] = None) -> Notebook:
         """Create a new notebook and persist it."""
         nid = str(uuid.uuid4())
-        now = datetime.utcnow().isoformat()
+        now = utc_iso()
         resolved = str(Path(path).expanduser().resolve())
 
         cell_objs: list[Cell] = []
@@ -262,13 +627,15 @@ class JupyterService:
         # Write .ipynb file
         nb_path = Path(resolved)
         nb_path.parent.mkdir(parents=True, exist_ok=True)
-        nb_path.write_text(json.dumps(self._build_ipynb(cell_objs, kernel), indent=2))
+        cell_dicts = [c.to_ipynb() for c in cell_objs]
+        atomic_write(nb_path, self._ipynb_bytes(cell_dicts, kernel))
+        st = nb_path.stat()
 
-        with get_conn() as conn:
+        with self._conn as conn:
             conn.execute(
-                "INSERT INTO notebooks(id, name, path, kernel, created_at, updated_at, cell_count, metadata) "
-                "VALUES (?,?,?,?,?,?,?,?)",
-                (nid, name, resolved, kernel, now, now, len(cell_objs), "{}"),
+                SQL_INSERT_NOTEBOOK,
+                (nid, name, resolved, kernel, now, now, len(cell_objs), "{}",
+                 json_dumps(cell_dicts), st.st_mtime_ns, st.st_size),
             )
 
         return Notebook(
@@ -277,54 +644,199 @@ class JupyterService:
         )
 
     def notebook_load(self, notebook_id: str) -> Notebook:
-        """Load notebook from DB and parse cells from .ipynb file."""
-        with get_conn() as conn:
-            row = conn.execute("SELECT * FROM notebooks WHERE id=?", (notebook_id,)).fetchone()
+        """Load notebook from DB.
+
+        The ``cells_blob`` column caches the cells of the .ipynb file together
+        with the file's mtime and size.  While those still match (or the file
+        is gone) cells are decoded from the blob; otherwise the file was
+        edited elsewhere, so it is parsed and the blob refreshed.
+        """
+        with self._conn as conn:
+            row = conn.execute(SQL_SELECT_NB_BY_ID, (notebook_id,)).fetchone()
         if not row:
             raise ValueError(f"Notebook {notebook_id!r} not found")
 
         nb = Notebook.from_row(row)
         nb_path = Path(nb.path)
-        if nb_path.exists():
-            data = json.loads(nb_path.read_text())
-            nb.cells = [Cell.from_ipynb(c) for c in data.get("cells", [])]
+        try:
+            st = nb_path.stat()
+        except FileNotFoundError:
+            st = None
+        blob = row["cells_blob"]
+        if blob is not None and (
+            st is None or (st.st_mtime_ns, st.st_size) == (row["file_mtime_ns"], row["file_size"])
+        ):
+            nb.cells = [Cell.from_ipynb(c) for c in json_loads(blob)]
+            return nb
+        if st is not None:
+            cell_dicts = json_loads(nb_path.read_bytes()).get("cells", [])
+            nb.cells = [Cell.from_ipynb(c) for c in cell_dicts]
+            nb.cell_count = len(nb.cells)
+            with self._conn as conn:
+                conn.execute(
+                    SQL_UPDATE_NB_CELLS,
+                    (json_dumps(cell_dicts), nb.cell_count, st.st_mtime_ns, st.st_size, nb.id),
+                )
         return nb
 
-    def notebook_execute(self, notebook_id: str, cell_index: Optional[int] = None, timeout: int = 60) -> list[Execution]:
-        """Execute one or all cells in a notebook. Returns execution records."""
+    def notebook_execute(
+        self,
+        notebook_id: str,
+        cell_index: Optional[int] = None,
+        timeout: int = 60,
+        parallel: int = 1,
+        use_cache: bool = True,
+        persistent: bool = False,
+    ) -> list[Execution]:
+        """Execute one or all cells in a notebook. Returns execution records.
+
+        Every code cell runs in its own subprocess on an asyncio event loop.
+        By default cells run one after another; with *parallel* > 1 up to that
+        many run at once.  Cells share no Python state but do share the
+        filesystem and other side effects, so only raise *parallel* for
+        notebooks whose cells do not depend on each other.  Results are
+        returned in cell order either way.
+
+        Successful outputs are cached by the SHA-256 of the cell source; with
+        *use_cache* a cell whose source was already run successfully is not
+        executed again and its cached output is reused.  Cells routed to
+        Ollama are never cached, so every run queries the model afresh.
+
+        With *persistent* the cells instead run sequentially in a single
+        :class:`PersistentKernel`, sharing state like a real notebook.  Output
+        then depends on earlier cells, so the cache is neither read nor written.
+
+        This method blocks.  When called while an event loop is already
+        running (Jupyter/IPython, async handlers) the cells run on a private
+        loop in a worker thread; async callers should prefer
+        :meth:`notebook_execute_async`.
+        """
+        jobs, hashes, cached = self._plan_execution(notebook_id, cell_index, use_cache, persistent)
+        if persistent:
+            outcomes = self._run_persistent(jobs, timeout)
+        else:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                outcomes = asyncio.run(self._run_cells(jobs, hashes, cached, timeout, parallel))
+            else:
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    outcomes = pool.submit(
+                        asyncio.run, self._run_cells(jobs, hashes, cached, timeout, parallel)
+                    ).result()
+        return self._record_executions(notebook_id, jobs, hashes, cached, outcomes, persistent)
+
+    async def notebook_execute_async(
+        self,
+        notebook_id: str,
+        cell_index: Optional[int] = None,
+        timeout: int = 60,
+        parallel: int = 1,
+        use_cache: bool = True,
+        persistent: bool = False,
+    ) -> list[Execution]:
+        """Awaitable form of :meth:`notebook_execute` for use on an event loop."""
+        jobs, hashes, cached = self._plan_execution(notebook_id, cell_index, use_cache, persistent)
+        if persistent:
+            outcomes = await asyncio.to_thread(self._run_persistent, jobs, timeout)
+        else:
+            outcomes = await self._run_cells(jobs, hashes, cached, timeout, parallel)
+        return self._record_executions(notebook_id, jobs, hashes, cached, outcomes, persistent)
+
+    def _plan_execution(
+        self, notebook_id: str, cell_index: Optional[int], use_cache: bool, persistent: bool,
+    ) -> tuple[list[tuple[int, str]], list[Optional[str]], dict[str, tuple[str, str]]]:
+        """Select the code cells to run, their cache keys and any cache hits."""
         nb = self.notebook_load(notebook_id)
         cells_to_run = nb.cells if cell_index is None else [nb.cells[cell_index]]
         indices = list(range(len(nb.cells))) if cell_index is None else [cell_index]
+        jobs = [(idx, cell.source_str) for idx, cell in zip(indices, cells_to_run) if cell.cell_type == "code"]
+        # A None hash marks a cell that must bypass the output cache
+        hashes: list[Optional[str]] = [
+            None if OllamaService.has_mention(source) else cell_hash(source) for _, source in jobs
+        ]
 
+        cached: dict[str, tuple[str, str]] = {}
+        if use_cache and not persistent:
+            for h in set(hashes) - {None}:
+                row = self._conn.execute(SQL_SELECT_CELL_CACHE, (h,)).fetchone()
+                if row:
+                    cached[h] = (row["output"], row["status"])
+        return jobs, hashes, cached
+
+    def _run_persistent(self, jobs: list[tuple[int, str]], timeout: int) -> list[tuple[str, str, int, int]]:
+        """Run *jobs* in order in one :class:`PersistentKernel`."""
+        outcomes = []
+        with PersistentKernel() as kernel:
+            for _, source in jobs:
+                started_ns = time.time_ns()
+                t0 = time.perf_counter_ns()
+                if OllamaService.has_mention(source):
+                    output, status = self._run_cell(source, timeout=timeout)
+                else:
+                    output, status = kernel.run(source, timeout=timeout)
+                outcomes.append((output, status, started_ns, time.perf_counter_ns() - t0))
+        return outcomes
+
+    async def _run_cells(
+        self,
+        jobs: list[tuple[int, str]],
+        hashes: list[Optional[str]],
+        cached: dict[str, tuple[str, str]],
+        timeout: int,
+        parallel: int,
+    ) -> list[tuple[str, str, int, int]]:
+        """Run *jobs* as concurrent subprocesses, at most *parallel* at once."""
+        limit = asyncio.Semaphore(max(1, parallel))
+
+        async def run(source: str, h: Optional[str]) -> tuple[str, str, int, int]:
+            async with limit:
+                started_ns = time.time_ns()
+                t0 = time.perf_counter_ns()
+                if h in cached:
+                    output, status = cached[h]
+                else:
+                    output, status = await self._run_cell_async(source, timeout=timeout)
+                return output, status, started_ns, time.perf_counter_ns() - t0
+
+        return await asyncio.gather(*(run(source, h) for (_, source), h in zip(jobs, hashes)))
+
+    def _record_executions(
+        self,
+        notebook_id: str,
+        jobs: list[tuple[int, str]],
+        hashes: list[Optional[str]],
+        cached: dict[str, tuple[str, str]],
+        outcomes: list[tuple[str, str, int, int]],
+        persistent: bool,
+    ) -> list[Execution]:
+        """Store execution rows and new cache entries in one transaction."""
         results: list[Execution] = []
-        for idx, cell in zip(indices, cells_to_run):
-            if cell.cell_type != "code":
-                continue
+        rows: list[tuple] = []
+        cache_rows: list[tuple] = []
+        for (idx, source), h, (output, status, started_ns, elapsed_ns) in zip(jobs, hashes, outcomes):
             exec_id = str(uuid.uuid4())
-            started = datetime.utcnow()
-            output, status = self._run_cell(cell.source, timeout=timeout)
-            finished = datetime.utcnow()
-            dur = int((finished - started).total_seconds() * 1000)
-
-            with get_conn() as conn:
-                conn.execute(
-                    "INSERT INTO executions(id, notebook_id, cell_index, source, output, status, "
-                    "started_at, finished_at, duration_ms) VALUES (?,?,?,?,?,?,?,?,?)",
-                    (exec_id, notebook_id, idx, cell.source, output, status,
-                     started.isoformat(), finished.isoformat(), dur),
-                )
-
+            dur = elapsed_ns // 1_000_000
+            # finished_at is derived from the monotonic duration, not a second clock read
+            started, finished = utc_iso(started_ns), utc_iso(started_ns + elapsed_ns)
+
+            rows.append((exec_id, notebook_id, idx, source, output, status,
+                         started, finished, dur))
+            if status == "success" and h is not None and h not in cached and not persistent:
+                cache_rows.append((h, output, status, finished))
             results.append(Execution(
                 id=exec_id, notebook_id=notebook_id, cell_index=idx,
-                source=cell.source, output=output, status=status,
-                started_at=started.isoformat(), finished_at=finished.isoformat(),
+                source=source, output=output, status=status,
+                started_at=started, finished_at=finished,
                 duration_ms=dur,
             ))
 
-        # Bump updated_at
-        now = datetime.utcnow().isoformat()
-        with get_conn() as conn:
-            conn.execute("UPDATE notebooks SET updated_at=? WHERE id=?", (now, notebook_id))
+        # Record every execution and bump updated_at in a single transaction
+        now = utc_iso()
+        with self._conn as conn:
+            conn.executemany(SQL_INSERT_EXECUTION, rows)
+            conn.executemany(SQL_UPSERT_CELL_CACHE, cache_rows)
+            conn.execute(SQL_TOUCH_NOTEBOOK, (now, notebook_id))
 
         return results
 
@@ -335,8 +847,14 @@ class JupyterService:
 
         if fmt == "ipynb":
             out_path = Path(nb.path)
-            data = self._build_ipynb(nb.cells, nb.kernel)
-            out_path.write_text(json.dumps(data, indent=2))
+            cell_dicts = [c.to_ipynb() for c in nb.cells]
+            atomic_write(out_path, self._ipynb_bytes(cell_dicts, nb.kernel))
+            st = out_path.stat()
+            with self._conn as conn:
+                conn.execute(
+                    SQL_UPDATE_NB_CELLS,
+                    (json_dumps(cell_dicts), len(nb.cells), st.st_mtime_ns, st.st_size, nb.id),
+                )
             return str(out_path)
 
         elif fmt == "script":
@@ -345,46 +863,102 @@ class JupyterService:
             for i, cell in enumerate(nb.cells):
                 if cell.cell_type == "code":
                     lines.append(f"# Cell {i}\n")
-                    lines.append(cell.source + "\n\n")
+                    lines.append(cell.source_str + "\n\n")
                 elif cell.cell_type == "markdown":
-                    for line in cell.source.splitlines():
-                        lines.append(f"# {line}\n")
-                    lines.append("\n")
-            out_path.write_text("".join(lines))
+                    commented = textwrap.indent(cell.source_str, "# ", lambda _: True)
+                    if commented and not commented.endswith("\n"):
+                        commented += "\n"
+                    lines.append(commented + "\n")
+            atomic_write(out_path, "".join(lines).encode())
             return str(out_path)
 
         elif fmt == "html":
             out_path = Path(nb.path).parent / f"{out_base}.html"
-            html = self._render_html(nb)
-            out_path.write_text(html)
+            atomic_write(out_path, self._render_html(nb).encode())
             return str(out_path)
 
         else:
             raise ValueError(f"Unsupported format: {fmt!r}. Choose from: ipynb, script, html")
 
+    def notebook_export_many(self, notebook_ids: list[str], fmt: str = "ipynb") -> list[str]:
+        """Export several notebooks, then flush them all to disk.
+
+        Files are written and renamed into place without syncing first, so
+        the OS can start writing them back while later exports run.  Each
+        file is then fdatasync'ed and each distinct parent directory fsynced
+        once, so the flushes happen after all writes were issued rather than
+        interleaved with them.
+        """
+        paths = [self.notebook_export(nid, fmt=fmt) for nid in notebook_ids]
+        for path in paths:
+            fsync_path(path)
+        for parent in {str(Path(p).parent) for p in paths}:
+            fsync_path(parent)
+        return paths
+
     def notebook_list(self) -> list[dict]:
-        with get_conn() as conn:
-            rows = conn.execute("SELECT * FROM notebooks ORDER BY updated_at DESC").fetchall()
-        return [dict(r) for r in rows]
+        return self._fetch_dicts(SQL_SELECT_NOTEBOOKS)
 
     def notebook_delete(self, notebook_id: str) -> None:
         nb = self.notebook_load(notebook_id)
         nb_path = Path(nb.path)
         if nb_path.exists():
             nb_path.unlink()
-        with get_conn() as conn:
-            conn.execute("DELETE FROM notebooks WHERE id=?", (notebook_id,))
+        with self._conn as conn:
+            conn.execute(SQL_DELETE_NOTEBOOK, (notebook_id,))
 
     def execution_history(self, notebook_id: str, limit: int = 50) -> list[dict]:
-        with get_conn() as conn:
-            rows = conn.execute(
-                "SELECT * FROM executions WHERE notebook_id=? ORDER BY started_at DESC LIMIT ?",
-                (notebook_id, limit),
-            ).fetchall()
-        return [dict(r) for r in rows]
+        return self._fetch_dicts(SQL_SELECT_EXECUTIONS, (notebook_id, limit))
+
+    def execution_get(self, exec_id: str) -> Execution:
+        """Load a single execution including its source and output."""
+        with self._conn as conn:
+            row = conn.execute(SQL_SELECT_EXECUTION_BY_ID, (exec_id,)).fetchone()
+        if not row:
+            raise ValueError(f"Execution {exec_id!r} not found")
+        return Execution.from_row(row)
+
+    # ── Outputs ────────────────────────────────────────────────────────
+
+    @staticmethod
+    def outputs_process(outputs: list[dict]) -> list[dict]:
+        """Decode base64 ``image/png`` payloads in cell outputs.
+
+        Returns one entry per image with its output index, decoded size in
+        bytes and SHA-256, e.g. for size accounting or de-duplication.
+        Decoding is done by ``binascii`` in C; malformed payloads are skipped.
+        """
+        images: list[dict] = []
+        for i, out in enumerate(outputs):
+            payload = (out.get("data") or {}).get("image/png")
+            if payload is None:
+                continue
+            if isinstance(payload, list):
+                payload = "".join(payload)
+            try:
+                raw = base64.b64decode(payload)
+            except (ValueError, TypeError):
+                continue
+            h = _SHA256.copy()
+            h.update(raw)
+            images.append({"index": i, "mime": "image/png", "bytes": len(raw), "sha256": h.hexdigest()})
+        return images
 
     # ── Internal helpers ───────────────────────────────────────────────
 
+    def _fetch_dicts(self, sql: str, params: tuple = ()) -> list[dict]:
+        """Run a query and return its rows as plain dicts.
+
+        Uses a tuple cursor and zips each row with the column names read once
+        from the cursor description, skipping the per-row ``sqlite3.Row``
+        object and its key lookups.
+        """
+        cur = self._conn.cursor()
+        cur.row_factory = None
+        cur.execute(sql, params)
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
     @staticmethod
     def _run_cell(source: str, timeout: int = 60) -> tuple[str, str]:
         """Execute a cell.
@@ -410,6 +984,28 @@ class JupyterService:
         except Exception as exc:
             return str(exc), "error"
 
+    @staticmethod
+    async def _run_cell_async(source: str, timeout: int = 60) -> tuple[str, str]:
+        """Non-blocking counterpart of :meth:`_run_cell` for use on an event loop."""
+        if OllamaService.has_mention(source):
+            return await asyncio.to_thread(OllamaService().query, source)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", source,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+        except Exception as exc:
+            return str(exc), "error"
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return "Execution timed out", "timeout"
+        if proc.returncode == 0:
+            return stdout.decode(errors="replace") or "(no output)", "success"
+        return stderr.decode(errors="replace") or "(error)", "error"
+
     @staticmethod
     def _build_ipynb(cells: list[Cell], kernel: str) -> dict:
         return {
@@ -426,21 +1022,48 @@ class JupyterService:
             "cells": [c.to_ipynb() for c in cells],
         }
 
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _ipynb_header(kernel: str) -> bytes:
+        """Serialized ipynb document up to the ``"cells":`` value, per kernel."""
+        skeleton = JupyterService._build_ipynb([], kernel)
+        skeleton["cells"] = None
+        data = json_dumps(skeleton, indent=True)
+        return data[: data.rindex(b"null")]
+
+    @staticmethod
+    def _ipynb_bytes(cells: list[dict], kernel: str) -> bytes:
+        """Serialize a notebook from already-converted ipynb cell dicts.
+
+        Produces the same bytes as ``json_dumps(_build_ipynb(...), indent=True)``
+        but only the cells are serialized; the metadata comes from a cached
+        header.  Newlines in indented JSON are always structural (string
+        newlines are escaped), so re-indenting the cells by one level is a
+        plain byte replace.
+        """
+        body = json_dumps(cells, indent=True).replace(b"\n", b"\n  ")
+        return JupyterService._ipynb_header(kernel) + body + b"\n}"
+
+    _HTML_STYLE = (
+        "<style>body{font-family:monospace;max-width:900px;margin:auto;padding:2rem}"
+        ".code{background:#f4f4f4;padding:1rem;border-radius:4px}"
+        ".md{padding:.5rem 0}</style>"
+    )
+
     @staticmethod
     def _render_html(nb: Notebook) -> str:
+        name = html.escape(nb.name)
         parts = [
             "<!DOCTYPE html><html><head>",
-            f"<title>{nb.name}</title>",
-            "<style>body{{font-family:monospace;max-width:900px;margin:auto;padding:2rem}}"
-            ".code{{background:#f4f4f4;padding:1rem;border-radius:4px}}"
-            ".md{{padding:.5rem 0}}</style></head><body>",
-            f"<h1>{nb.name}</h1>",
+            f"<title>{name}</title>",
+            JupyterService._HTML_STYLE + "</head><body>",
+            f"<h1>{name}</h1>",
         ]
         for i, cell in enumerate(nb.cells):
             if cell.cell_type == "code":
-                parts.append(f'<div class="code"><pre>[{i}]: {cell.source}</pre></div>')
+                parts.append(f'<div class="code"><pre>[{i}]: {html.escape(cell.source_str)}</pre></div>')
             elif cell.cell_type == "markdown":
-                parts.append(f'<div class="md"><p>{cell.source}</p></div>')
+                parts.append(f'<div class="md"><p>{html.escape(cell.source_str)}</p></div>')
         parts.append("</body></html>")
         return "\n".join(parts)
 
@@ -449,22 +1072,36 @@ class JupyterService:
 # CLI
 # ─────────────────────────────────────────────
 
+def print_json(obj: Any) -> None:
+    """Write *obj* to stdout as indented JSON, bypassing text re-encoding."""
+    data = json_dumps(obj, indent=True) + b"\n"
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:  # e.g. stdout replaced by a StringIO
+        sys.stdout.write(data.decode())
+        return
+    sys.stdout.flush()
+    buffer.write(data)
+    buffer.flush()
+
+
 def cmd_create(args: argparse.Namespace) -> None:
     svc = JupyterService()
     nb = svc.notebook_create(args.name, args.path, kernel=args.kernel)
-    print(json.dumps({"id": nb.id, "name": nb.name, "path": nb.path}, indent=2))
+    print_json({"id": nb.id, "name": nb.name, "path": nb.path})
 
 
 def cmd_list(args: argparse.Namespace) -> None:
     svc = JupyterService()
     items = svc.notebook_list()
-    print(json.dumps(items, indent=2))
+    print_json(items)
 
 
 def cmd_execute(args: argparse.Namespace) -> None:
     svc = JupyterService()
     idx = args.cell if args.cell is not None else None
-    results = svc.notebook_execute(args.id, cell_index=idx, timeout=args.timeout)
+    results = svc.notebook_execute(args.id, cell_index=idx, timeout=args.timeout,
+                                   parallel=args.parallel, use_cache=not args.no_cache,
+                                   persistent=args.persistent)
     for r in results:
         status_icon = "✓" if r.status == "success" else "✗"
         print(f"{status_icon} Cell {r.cell_index} [{r.status}] ({r.duration_ms}ms)")
@@ -481,7 +1118,13 @@ def cmd_export(args: argparse.Namespace) -> None:
 def cmd_history(args: argparse.Namespace) -> None:
     svc = JupyterService()
     hist = svc.execution_history(args.id, limit=args.limit)
-    print(json.dumps(hist, indent=2))
+    print_json(hist)
+
+
+def cmd_execution(args: argparse.Namespace) -> None:
+    svc = JupyterService()
+    ex = svc.execution_get(args.exec_id)
+    print_json(asdict(ex))
 
 
 def cmd_kernels(args: argparse.Namespace) -> None:
@@ -490,7 +1133,7 @@ def cmd_kernels(args: argparse.Namespace) -> None:
     if not kernels:
         print("No kernels registered. Default: python3")
     else:
-        print(json.dumps(kernels, indent=2))
+        print_json(kernels)
 
 
 def cmd_ollama(args: argparse.Namespace) -> None:
@@ -530,6 +1173,12 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument("id", help="Notebook ID")
     p.add_argument("--cell", type=int, default=None, help="Execute single cell by index")
     p.add_argument("--timeout", type=int, default=60, help="Timeout per cell in seconds")
+    p.add_argument("--parallel", type=int, default=1, metavar="N",
+                   help="Run up to N cells concurrently; only for cells that do not "
+                        "depend on each other's side effects [default: 1]")
+    p.add_argument("--no-cache", action="store_true", help="Re-run cells even if a cached output exists")
+    p.add_argument("--persistent", action="store_true",
+                   help="Run cells in order in one long-lived kernel that shares state")
     p.set_defaults(func=cmd_execute)
 
     # export
@@ -544,6 +1193,11 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument("--limit", type=int, default=50)
     p.set_defaults(func=cmd_history)
 
+    # execution
+    p = sub.add_parser("execution", help="Show a single execution including its output")
+    p.add_argument("exec_id", help="Execution ID (see history)")
+    p.set_defaults(func=cmd_execution)
+
     # kernels
     p = sub.add_parser("kernels", help="List registered kernels")
     p.set_defaults(func=cmd_kernels)
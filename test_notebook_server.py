@@ -5,11 +5,15 @@ import sys
 import tempfile
 import unittest
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 os.environ["NOTEBOOK_DB"] = str(Path(tempfile.mkdtemp()) / "test_notebooks.db")
 sys.path.insert(0, str(Path(__file__).parent))
-from main import Cell, JupyterService, Notebook, OllamaService, init_db
+import main
+from main import (
+    Cell, JupyterService, Notebook, OllamaService, PersistentKernel,
+    atomic_write, cell_hash, get_conn, init_db, json_dumps, json_loads, print_json, utc_iso,
+)
 
 
 class TestCell(unittest.TestCase):
@@ -28,8 +32,125 @@ class TestCell(unittest.TestCase):
     def test_from_ipynb_list_source(self):
         data = {"cell_type": "code", "source": ["x = 1\n", "y = 2"], "outputs": [], "execution_count": None}
         cell = Cell.from_ipynb(data)
-        self.assertIn("x = 1", cell.source)
-        self.assertIn("y = 2", cell.source)
+        self.assertIn("x = 1", cell.source_str)
+        self.assertIn("y = 2", cell.source_str)
+
+    def test_list_source_round_trips_without_copy(self):
+        lines = ["x = 1\n", "y = 2"]
+        cell = Cell.from_ipynb({"cell_type": "code", "source": lines})
+        self.assertEqual(cell.source_str, "x = 1\ny = 2")
+        self.assertIs(cell.to_ipynb()["source"], lines)
+        self.assertEqual(Cell(cell_type="code", source="a\nb").to_ipynb()["source"], ["a\n", "b"])
+
+    def test_source_subclasses_and_tuples(self):
+        class Src(str):
+            pass
+        cell = Cell(cell_type="code", source=Src("a\nb"))
+        self.assertEqual(cell.source_str, "a\nb")
+        self.assertEqual(cell.to_ipynb()["source"], ["a\n", "b"])
+        cell = Cell(cell_type="code", source=("a\n", "b"))
+        self.assertEqual(cell.source_str, "a\nb")
+        self.assertEqual(cell.to_ipynb()["source"], ["a\n", "b"])
+
+
+class TestJsonHelpers(unittest.TestCase):
+    def test_roundtrip(self):
+        obj = {"cells": [{"source": ["x = 1\n"]}], "name": "café"}
+        self.assertEqual(json_loads(json_dumps(obj, indent=True)), obj)
+
+    def test_stdlib_fallback(self):
+        obj = {"a": [1, 2], "b": "é"}
+        with patch.object(main, "orjson", None):
+            data = json_dumps(obj, indent=True)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(json_loads(data), obj)
+
+
+class TestPrintJson(unittest.TestCase):
+    def test_writes_bytes_to_stdout_buffer(self):
+        import io
+        raw = io.BytesIO()
+        stdout = io.TextIOWrapper(raw, encoding="utf-8")
+        with patch.object(sys, "stdout", stdout):
+            print("before")
+            print_json([{"name": "é"}])
+        self.assertEqual(raw.getvalue().decode().splitlines()[0], "before")
+        self.assertEqual(json.loads(raw.getvalue().decode().split("\n", 1)[1]), [{"name": "é"}])
+
+    def test_falls_back_to_text_stdout(self):
+        import io
+        out = io.StringIO()
+        with patch.object(sys, "stdout", out):
+            print_json({"a": 1})
+        self.assertEqual(json.loads(out.getvalue()), {"a": 1})
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def test_replaces_file_without_leaving_temp(self):
+        tmp = Path(tempfile.mkdtemp())
+        target = tmp / "nb.ipynb"
+        target.write_bytes(b"old")
+        atomic_write(target, b"new", fsync=True)
+        self.assertEqual(target.read_bytes(), b"new")
+        self.assertEqual([p.name for p in tmp.iterdir()], ["nb.ipynb"])
+
+    def test_failed_write_removes_temp(self):
+        tmp = Path(tempfile.mkdtemp())
+        target = tmp / "nb.ipynb"
+        target.write_bytes(b"old")
+        with patch.object(main, "_fdatasync", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                atomic_write(target, b"new", fsync=True)
+        self.assertEqual(target.read_bytes(), b"old")
+        self.assertEqual([p.name for p in tmp.iterdir()], ["nb.ipynb"])
+
+    def test_preserves_existing_mode(self):
+        tmp = Path(tempfile.mkdtemp())
+        target = tmp / "nb.ipynb"
+        target.write_bytes(b"old")
+        target.chmod(0o600)
+        atomic_write(target, b"new")
+        self.assertEqual(target.stat().st_mode & 0o777, 0o600)
+
+    def test_new_file_uses_umask_mode(self):
+        tmp = Path(tempfile.mkdtemp())
+        target = tmp / "nb.ipynb"
+        atomic_write(target, b"new")
+        self.assertEqual(target.stat().st_mode & 0o777, 0o666 & ~main._UMASK)
+
+
+class TestCellHash(unittest.TestCase):
+    def test_matches_sha256(self):
+        import hashlib
+        for src in ("", "print(1)", "x = 'é'\n" * 100):
+            self.assertEqual(cell_hash(src), hashlib.sha256(src.encode()).hexdigest())
+
+
+class TestUtcIso(unittest.TestCase):
+    def test_matches_datetime_isoformat(self):
+        from datetime import datetime, timedelta
+        ns = 1_700_000_000_123_456_789
+        expected = datetime(1970, 1, 1) + timedelta(microseconds=ns // 1000)
+        self.assertEqual(utc_iso(ns), expected.isoformat(timespec="microseconds"))
+        self.assertEqual(utc_iso(ns + 1_000_000_000)[:19], "2023-11-14T22:13:21")
+
+
+class TestOutputsProcess(unittest.TestCase):
+    def test_decodes_png_payloads(self):
+        import base64
+        import hashlib
+        png = b"\x89PNG\r\n\x1a\n" + bytes(range(64))
+        b64 = base64.b64encode(png).decode()
+        outputs = [
+            {"output_type": "stream", "name": "stdout", "text": ["hi\n"]},
+            {"output_type": "display_data", "data": {"image/png": [b64[:20] + "\n", b64[20:]]}},
+            {"output_type": "display_data", "data": {"image/png": "not*base64!"}},
+        ]
+        images = JupyterService.outputs_process(outputs)
+        self.assertEqual(len(images), 1)
+        self.assertEqual(images[0]["index"], 1)
+        self.assertEqual(images[0]["bytes"], len(png))
+        self.assertEqual(images[0]["sha256"], hashlib.sha256(png).hexdigest())
 
 
 class TestJupyterService(unittest.TestCase):
@@ -38,6 +159,22 @@ class TestJupyterService(unittest.TestCase):
         self.svc = JupyterService()
         self.tmp = Path(tempfile.mkdtemp())
 
+    def test_connection_reused_per_thread(self):
+        self.assertIs(get_conn(), get_conn())
+        self.assertIs(JupyterService()._conn, self.svc._conn)
+
+    def test_execution_indexes(self):
+        names = {r[0] for r in get_conn().execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='executions'")}
+        self.assertIn("idx_exec_nb_started", names)
+        self.assertNotIn("idx_exec_nb", names)
+
+    def test_connection_pragmas(self):
+        conn = get_conn()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+
     def test_notebook_create_and_load(self):
         nb = self.svc.notebook_create("Test NB", str(self.tmp / "test.ipynb"))
         self.assertTrue(Path(nb.path).exists())
@@ -51,6 +188,47 @@ class TestJupyterService(unittest.TestCase):
         loaded = self.svc.notebook_load(nb.id)
         self.assertEqual(len(loaded.cells), 1)
 
+    def test_ipynb_bytes_matches_full_serialization(self):
+        cells = [Cell(cell_type="code", source="print('a\\nb')\nx = 1"), Cell(cell_type="markdown", source="# T")]
+        for orjson_mod in (main.orjson, None):
+            with patch.object(main, "orjson", orjson_mod):
+                JupyterService._ipynb_header.cache_clear()
+                for kernel, cell_list in (("python3", cells), ("other", [])):
+                    expected = json_dumps(JupyterService._build_ipynb(cell_list, kernel), indent=True)
+                    actual = JupyterService._ipynb_bytes([c.to_ipynb() for c in cell_list], kernel)
+                    self.assertEqual(actual, expected)
+        JupyterService._ipynb_header.cache_clear()
+
+    def test_notebook_load_uses_cells_blob(self):
+        cells = [{"cell_type": "code", "source": "print('blob')"}]
+        nb = self.svc.notebook_create("Blob NB", str(self.tmp / "blob.ipynb"), cells=cells)
+        Path(nb.path).unlink()
+        loaded = self.svc.notebook_load(nb.id)
+        self.assertEqual(loaded.cells[0].source_str, "print('blob')")
+
+    def test_notebook_load_legacy_reads_file(self):
+        cells = [{"cell_type": "code", "source": "print('legacy')"}]
+        nb = self.svc.notebook_create("Legacy NB", str(self.tmp / "legacy.ipynb"), cells=cells)
+        with self.svc._conn as conn:
+            conn.execute("UPDATE notebooks SET cells_blob=NULL WHERE id=?", (nb.id,))
+        loaded = self.svc.notebook_load(nb.id)
+        self.assertEqual(loaded.cells[0].source_str, "print('legacy')")
+
+    def test_notebook_sees_file_edited_after_create(self):
+        nb = self.svc.notebook_create("Edited NB", str(self.tmp / "edited.ipynb"))
+        path = Path(nb.path)
+        data = json.loads(path.read_text())
+        data["cells"].append({"cell_type": "code", "source": ["print('edited')"],
+                              "metadata": {}, "outputs": [], "execution_count": None})
+        path.write_text(json.dumps(data))
+        loaded = self.svc.notebook_load(nb.id)
+        self.assertEqual([c.source_str for c in loaded.cells], ["print('edited')"])
+        results = self.svc.notebook_execute(nb.id, use_cache=False)
+        self.assertEqual(len(results), 1)
+        self.assertIn("edited", results[0].output)
+        self.svc.notebook_export(nb.id, fmt="ipynb")
+        self.assertEqual(len(json.loads(path.read_text())["cells"]), 1)
+
     def test_notebook_execute_success(self):
         cells = [{"cell_type": "code", "source": "x = 2 + 2\nprint(x)"}]
         nb = self.svc.notebook_create("Exec Test", str(self.tmp / "exec.ipynb"), cells=cells)
@@ -65,6 +243,79 @@ class TestJupyterService(unittest.TestCase):
         results = self.svc.notebook_execute(nb.id)
         self.assertEqual(results[0].status, "error")
 
+    def test_notebook_execute_parallel_keeps_cell_order(self):
+        cells = [
+            {"cell_type": "code", "source": "import time; time.sleep(0.2); print('a')"},
+            {"cell_type": "markdown", "source": "# skip"},
+            {"cell_type": "code", "source": "print('b')"},
+        ]
+        nb = self.svc.notebook_create("Par Test", str(self.tmp / "par.ipynb"), cells=cells)
+        results = self.svc.notebook_execute(nb.id, parallel=2)
+        self.assertEqual([r.cell_index for r in results], [0, 2])
+        self.assertEqual([r.output.strip() for r in results], ["a", "b"])
+
+    def test_notebook_execute_sequential_by_default(self):
+        dep = self.tmp / "dep.txt"
+        cells = [
+            {"cell_type": "code", "source": f"import time; time.sleep(0.2); open({str(dep)!r}, 'w').write('ok')"},
+            {"cell_type": "code", "source": f"print(open({str(dep)!r}).read())"},
+        ]
+        nb = self.svc.notebook_create("Seq", str(self.tmp / "seq.ipynb"), cells=cells)
+        results = self.svc.notebook_execute(nb.id, use_cache=False)
+        self.assertEqual([r.status for r in results], ["success", "success"])
+        self.assertIn("ok", results[1].output)
+
+    def test_notebook_execute_reuses_cached_output(self):
+        cells = [{"cell_type": "code", "source": "print('cached-cell')"}]
+        nb = self.svc.notebook_create("Cache Test", str(self.tmp / "cache.ipynb"), cells=cells)
+        first = self.svc.notebook_execute(nb.id)
+        with patch.object(JupyterService, "_run_cell_async", new=AsyncMock(side_effect=AssertionError("not cached"))):
+            second = self.svc.notebook_execute(nb.id)
+        self.assertEqual(second[0].output, first[0].output)
+        with patch.object(JupyterService, "_run_cell_async", new=AsyncMock(return_value=("fresh", "success"))) as run:
+            third = self.svc.notebook_execute(nb.id, use_cache=False)
+        run.assert_called_once()
+        self.assertEqual(third[0].output, "fresh")
+
+    def test_notebook_execute_does_not_cache_ollama_cells(self):
+        cells = [{"cell_type": "code", "source": "@ollama tell me a joke"}]
+        nb = self.svc.notebook_create("AI Cache", str(self.tmp / "ai.ipynb"), cells=cells)
+        answers = [("first", "success"), ("second", "success")]
+        with patch.object(OllamaService, "query", side_effect=answers) as query:
+            first = self.svc.notebook_execute(nb.id)
+            second = self.svc.notebook_execute(nb.id)
+        self.assertEqual(query.call_count, 2)
+        self.assertEqual([first[0].output, second[0].output], ["first", "second"])
+
+    def test_notebook_execute_inside_running_loop(self):
+        import asyncio
+        cells = [{"cell_type": "code", "source": "print('in loop')"}]
+        nb = self.svc.notebook_create("Loop", str(self.tmp / "loop.ipynb"), cells=cells)
+
+        async def call_sync():
+            return self.svc.notebook_execute(nb.id, use_cache=False)
+
+        results = asyncio.run(call_sync())
+        self.assertIn("in loop", results[0].output)
+
+    def test_notebook_execute_async(self):
+        import asyncio
+        cells = [{"cell_type": "code", "source": "print('awaited')"},
+                 {"cell_type": "code", "source": "v = 5"}]
+        nb = self.svc.notebook_create("Async", str(self.tmp / "async.ipynb"), cells=cells)
+        results = asyncio.run(self.svc.notebook_execute_async(nb.id, use_cache=False))
+        self.assertEqual([r.status for r in results], ["success", "success"])
+        self.assertIn("awaited", results[0].output)
+        results = asyncio.run(self.svc.notebook_execute_async(nb.id, persistent=True))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(self.svc.execution_history(nb.id)), 4)
+
+    def test_notebook_execute_timeout(self):
+        cells = [{"cell_type": "code", "source": "import time; time.sleep(5)"}]
+        nb = self.svc.notebook_create("Timeout", str(self.tmp / "timeout.ipynb"), cells=cells)
+        results = self.svc.notebook_execute(nb.id, timeout=1)
+        self.assertEqual(results[0].status, "timeout")
+
     def test_notebook_export_script(self):
         cells = [{"cell_type": "code", "source": "x = 1"}]
         nb = self.svc.notebook_create("Export Test", str(self.tmp / "export.ipynb"), cells=cells)
@@ -72,10 +323,38 @@ class TestJupyterService(unittest.TestCase):
         self.assertTrue(out.endswith(".py"))
         self.assertTrue(Path(out).exists())
 
+    def test_notebook_export_script_comments_markdown(self):
+        cells = [
+            {"cell_type": "markdown", "source": "# Title\n\nBody"},
+            {"cell_type": "code", "source": "x = 1"},
+        ]
+        nb = self.svc.notebook_create("Script MD", str(self.tmp / "md.ipynb"), cells=cells)
+        text = Path(self.svc.notebook_export(nb.id, fmt="script")).read_text()
+        self.assertEqual(text, "# # Title\n# \n# Body\n\n# Cell 1\nx = 1\n\n")
+
+    def test_notebook_export_html_escapes(self):
+        cells = [{"cell_type": "code", "source": "print(1 < 2 & True)"}]
+        nb = self.svc.notebook_create("<b>NB</b>", str(self.tmp / "esc.ipynb"), cells=cells)
+        text = Path(self.svc.notebook_export(nb.id, fmt="html")).read_text()
+        self.assertIn("<title>&lt;b&gt;NB&lt;/b&gt;</title>", text)
+        self.assertIn("print(1 &lt; 2 &amp; True)", text)
+        self.assertIn("body{font-family", text)
+
+    def test_notebook_export_many(self):
+        ids = [
+            self.svc.notebook_create(f"Many {i}", str(self.tmp / f"many{i}.ipynb"),
+                                     cells=[{"cell_type": "code", "source": f"x = {i}"}]).id
+            for i in range(3)
+        ]
+        paths = self.svc.notebook_export_many(ids, fmt="script")
+        self.assertEqual([Path(p).name for p in paths], ["many0.py", "many1.py", "many2.py"])
+        self.assertIn("x = 2", Path(paths[2]).read_text())
+
     def test_notebook_list(self):
         self.svc.notebook_create("List NB", str(self.tmp / "list.ipynb"))
         items = self.svc.notebook_list()
         self.assertGreaterEqual(len(items), 1)
+        self.assertEqual(set(items[0]), {"id", "name", "path", "kernel", "created_at", "updated_at", "cell_count"})
 
     def test_execution_history(self):
         cells = [{"cell_type": "code", "source": "print(42)"}]
@@ -83,6 +362,83 @@ class TestJupyterService(unittest.TestCase):
         self.svc.notebook_execute(nb.id)
         hist = self.svc.execution_history(nb.id)
         self.assertGreaterEqual(len(hist), 1)
+        self.assertNotIn("output", hist[0])
+        ex = self.svc.execution_get(hist[0]["id"])
+        self.assertIn("42", ex.output)
+        with self.assertRaises(ValueError):
+            self.svc.execution_get("missing")
+
+
+class TestPersistentKernel(unittest.TestCase):
+    def test_state_shared_between_cells(self):
+        with PersistentKernel() as kernel:
+            self.assertEqual(kernel.run("x = 40"), ("(no output)", "success"))
+            output, status = kernel.run("print(x + 2)")
+        self.assertEqual(status, "success")
+        self.assertEqual(output.strip(), "42")
+
+    def test_error_returns_traceback(self):
+        with PersistentKernel() as kernel:
+            output, status = kernel.run("raise ValueError('boom')")
+            self.assertEqual(status, "error")
+            self.assertIn("ValueError: boom", output)
+            self.assertEqual(kernel.run("print('still alive')")[1], "success")
+
+    def test_forged_sentinel_is_stray_output(self):
+        with PersistentKernel() as kernel:
+            output, status = kernel.run("import os; os.system('echo __CELL_DONE__x')")
+        self.assertEqual(status, "success")
+        self.assertIn("__CELL_DONE__x", output)
+
+    def test_unterminated_fd_writes(self):
+        sources = {
+            "import os; os.write(1, b'abc')": "abc",
+            "import sys; print('x', end='', file=sys.__stdout__)": "x",
+            "import os; os.system('printf hi')": "hi",
+        }
+        with PersistentKernel() as kernel:
+            kernel.run("state = 1")
+            for src, expected in sources.items():
+                self.assertEqual(kernel.run(src, timeout=5), (expected, "success"), src)
+            self.assertEqual(kernel.run("print(state)")[0].strip(), "1")
+
+    def test_stdin_reads_see_devnull(self):
+        with PersistentKernel() as kernel:
+            output, status = kernel.run(
+                "import sys, subprocess\n"
+                "print(repr(sys.stdin.readline()))\n"
+                "subprocess.run(['cat'])\n",
+                timeout=5,
+            )
+            self.assertEqual((output.strip(), status), ("''", "success"))
+            self.assertEqual(kernel.run("print('next')")[0].strip(), "next")
+
+    def test_exit_status_matches_subprocess(self):
+        for src in ("import sys; sys.exit(0)", "exit()", "import sys; sys.exit(3)", "raise ValueError('boom')"):
+            with PersistentKernel() as kernel:
+                output, status = kernel.run(src)
+            expected_output, expected_status = JupyterService._run_cell(src)
+            self.assertEqual(status, expected_status, src)
+            self.assertEqual(output, expected_output, src)
+
+    def test_timeout_restarts_kernel(self):
+        with PersistentKernel() as kernel:
+            self.assertEqual(kernel.run("import time; time.sleep(5)", timeout=1)[1], "timeout")
+            output, status = kernel.run("print('restarted')")
+        self.assertEqual(status, "success")
+        self.assertIn("restarted", output)
+
+    def test_notebook_execute_persistent(self):
+        init_db()
+        svc = JupyterService()
+        cells = [
+            {"cell_type": "code", "source": "total = 3"},
+            {"cell_type": "code", "source": "print(total * 2)"},
+        ]
+        nb = svc.notebook_create("Persist", str(Path(tempfile.mkdtemp()) / "p.ipynb"), cells=cells)
+        results = svc.notebook_execute(nb.id, persistent=True)
+        self.assertEqual([r.status for r in results], ["success", "success"])
+        self.assertIn("6", results[1].output)
 
 
 class TestOllamaService(unittest.TestCase):
@@ -140,6 +496,12 @@ class TestOllamaService(unittest.TestCase):
         self.assertEqual(status, "success")
         self.assertEqual(output, "ollama answer")
 
+    def test_run_cell_async_routes_mention_to_ollama(self):
+        import asyncio
+        with patch("urllib.request.urlopen", return_value=self._FakeOllamaResponse("async answer")):
+            output, status = asyncio.run(JupyterService._run_cell_async("@ollama hi"))
+        self.assertEqual((output, status), ("async answer", "success"))
+
     def test_run_cell_plain_python_not_routed(self):
         output, status = JupyterService._run_cell("print('hello')")
         self.assertEqual(status, "success")